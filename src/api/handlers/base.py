@@ -1,11 +1,33 @@
-from typing import TypeVar, Optional
+from typing import TypeVar
 
-from core.protocol.base import BaseCommand, BaseResponse
+from pydantic import ValidationError
+from pydantic_core import ErrorDetails
+
+from core.protocol.base import BaseCommand, BaseResponse, Status
+from core.protocol.responses import DefaultResponse
 
 ReqT = TypeVar('ReqT', bound=BaseCommand)
 RespT = TypeVar('RespT', bound=BaseResponse)
 
+UNKNOWN_COMMAND = DefaultResponse(status=Status.ERROR, message="Unknown command").to_bytes()
+
+
+def _describe(error: ErrorDetails) -> str:
+    # The first location item is the command tag the union picked, the rest is the path to the field
+    path = '.'.join(map(str, error['loc'][1:]))
+    return f"{path}: {error['msg']}" if path else error['msg']
+
+
+def rejected(error: ValidationError) -> BaseResponse | bytes:
+    # The discriminator is checked before any field, so a bad or missing tag is the only error reported
+    errors = error.errors(include_url=False, include_input=False)
+    if errors[0]['type'] in ('union_tag_invalid', 'union_tag_not_found'):
+        return UNKNOWN_COMMAND
+    # Only field paths and messages are reported, str(error) would echo the submitted values, passwords included
+    details = '; '.join(_describe(e) for e in errors)
+    return DefaultResponse(status=Status.ERROR, message=f"Invalid command: {details}")
+
 
 class CommandHandlerInterface:
-    async def handle_command(self, command: BaseCommand, peer_key: Optional[str] = None) -> BaseResponse:
+    async def handle_command(self, data: bytes, peer_key: str) -> BaseResponse | bytes:
         raise NotImplementedError
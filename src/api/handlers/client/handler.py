@@ -1,87 +1,74 @@
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Awaitable, Callable
 
-from core.protocol.base import Status, ClientCommandType
-from core.protocol.requests import AuthCommand, UpdateClientSpecs, LogoutCommand
+from pydantic import ValidationError
+
+from api.handlers.base import CommandHandlerInterface, rejected
+from core.protocol.base import BaseResponse, Status
+from core.protocol.requests import AuthCommand, UpdateClientSpecs, LogoutCommand, client_commands
 from core.protocol.responses import AuthResponse, VMInfoResponse, DefaultResponse
 from services.client.vm_client import VMClientService
 
 logger = logging.getLogger(__name__)
 
+_AUTH_FAILED = AuthResponse.failed().to_bytes()
+_LOGGED_OUT = AuthResponse.logged_out().to_bytes()
+_UPDATE_FAILED = VMInfoResponse(status=Status.ERROR, message="Failed to update specs").to_bytes()
+
 
-class ClientCommandHandler:
-    def __init__(self, vm_service: VMClientService):
+class ClientCommandHandler(CommandHandlerInterface):
+    def __init__(self, vm_service: VMClientService) -> None:
         self.vm_service = vm_service
-        self.handlers = {
-            ClientCommandType.AUTH: self.handle_auth,
-            ClientCommandType.UPDATE: self.handle_update,
-            ClientCommandType.LOGOUT: self.handle_logout
+        self.handlers: Dict[type, Callable[[Any, str], Awaitable[BaseResponse | bytes]]] = {
+            AuthCommand: self.handle_auth,
+            UpdateClientSpecs: self.handle_update,
+            LogoutCommand: self.handle_logout
         }
 
-    async def handle_command(self, command: Dict[str, Any], peer_key: str):
+    async def handle_command(self, data: bytes, peer_key: str) -> BaseResponse | bytes:
+        try:
+            command = client_commands.validate_json(data)
+        except ValidationError as e:
+            return rejected(e)
         try:
-            command_type = ClientCommandType(command['command'])
-            handler = self.handlers.get(command_type)
-            if handler:
-                return await handler(command, peer_key)
-            return DefaultResponse(status=Status.ERROR, message="Unknown command")
+            return await self.handlers[type(command)](command, peer_key)
         except Exception as e:
-            logger.error(f"Error handling command: {e}")
+            logger.error("Error handling command: %s", e)
             return DefaultResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_auth(self, command: Dict[str, Any], peer_key: str) -> AuthResponse:
+    async def handle_auth(self, auth_command: AuthCommand, peer_key: str) -> AuthResponse | bytes:
         try:
-            auth_command = AuthCommand(**command)
-            is_authenticated = await self.vm_service.auth(
-                vm_id=auth_command.vm_id,
-                username=auth_command.username,
-                password=auth_command.password,
-                peer_key=peer_key
-            )
+            is_authenticated = await self.vm_service.auth(**auth_command.params(), peer_key=peer_key)
 
             if is_authenticated:
                 specs = await self.vm_service.get_info(peer_key)
                 if specs:
                     return AuthResponse.success(specs)
-            return AuthResponse.failed()
+            return _AUTH_FAILED
         except Exception as e:
-            logger.error(f"Auth error: {e}")
-            return AuthResponse.failed()
+            logger.error("Auth error: %s", e)
+            return _AUTH_FAILED
 
-    async def handle_logout(self, command: Dict[str, Any], peer_key: str) -> AuthResponse:
+    async def handle_logout(self, logout_command: LogoutCommand, peer_key: str) -> AuthResponse | bytes:
         try:
-            logout_command = LogoutCommand(**command)
-            success = await self.vm_service.logout(
-                peer_key=str(peer_key),
-            )
+            success = await self.vm_service.logout(peer_key)
 
             if success:
-                print(f"logout status: {success}")
-                return AuthResponse.logged_out()
-            return AuthResponse.failed()
+                return _LOGGED_OUT
+            return _AUTH_FAILED
         except Exception as e:
-            logger.error(f"Logout error: {e}")
+            logger.error("Logout error: %s", e)
             return AuthResponse.failed(msg=str(e))
 
-    async def handle_update(self, command: Dict[str, Any], peer_key: str) -> VMInfoResponse:
+    async def handle_update(self, update_command: UpdateClientSpecs, peer_key: str) -> VMInfoResponse | bytes:
         try:
-            update_command = UpdateClientSpecs(**command)
-            success = await self.vm_service.update_specs(
-                peer_key=peer_key,
-                id=update_command.id,
-                ram=update_command.ram,
-                cpu=update_command.cpu,
-                hds=update_command.hds
-            )
+            success = await self.vm_service.update_specs(peer_key=peer_key, **update_command.params())
 
             if success:
                 specs = await self.vm_service.get_info(peer_key)
                 if specs:
                     return VMInfoResponse(status=Status.OK, data=specs)
-            return VMInfoResponse(
-                status=Status.ERROR,
-                message="Failed to update specs"
-            )
+            return _UPDATE_FAILED
         except Exception as e:
-            logger.error(f"Update error: {e}")
+            logger.error("Update error: %s", e)
             return VMInfoResponse(status=Status.ERROR, message=str(e))
@@ -1,46 +1,50 @@
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Awaitable, Callable
 
-from api.handlers.base import CommandHandlerInterface
+from pydantic import ValidationError
+
+from api.handlers.base import CommandHandlerInterface, rejected
 from core.models import HardDrive
-from core.protocol.base import Status, ManagerCommandType
+from core.protocol.base import BaseResponse, Status
 from core.protocol.requests import (
     ConnectCommand, LogoutClientCommand, UpdateSpecsCommand,
     GetInfoCommand, AddDriveCommand, RemoveDriveCommand,
-    ListVMsCommand, AddVMCommand, ListDrivesCommand
+    ListVMsCommand, AddVMCommand, ListDrivesCommand, manager_commands
 )
-from core.protocol.responses import VMResponse, DriveResponse, VMListResponse, DefaultResponse, ListDrivesResponse
+from core.protocol.responses import VMResponse, DriveResponse, VMListResponse, ListDrivesResponse
 from services.server.vm_server import VMService
 import logging
 
 logger = logging.getLogger(__name__)
 
+_CONNECTION_FAILED = VMResponse(status=Status.ERROR, message="Connection failed", is_connected=False).to_bytes()
+_DEFAULT_DRIVES = (HardDrive(size=4, id=0, vm_id=0),)
+
 
 class CommandHandler(CommandHandlerInterface):
-    def __init__(self, vm_service: VMService):
+    def __init__(self, vm_service: VMService) -> None:
         self.vm_service = vm_service
-        self.handlers = {
-            ManagerCommandType.CONNECT: self.handle_connect,
-            ManagerCommandType.LOGOUT: self.handle_logout,
-            ManagerCommandType.UPDATE_SPECS: self.handle_update_specs,
-            ManagerCommandType.GET_INFO: self.handle_get_info,
-            ManagerCommandType.ADD_DRIVE: self.handle_add_drive,
-            ManagerCommandType.REMOVE_DRIVE: self.handle_remove_drive,
-            ManagerCommandType.LIST_VMS: self.handle_list_vms,
-            ManagerCommandType.ADD_VM: self.handle_add_vm,
-            ManagerCommandType.LIST_DRIVES: self.handle_list_drives
+        self.handlers: Dict[type, Callable[[Any], Awaitable[BaseResponse | bytes]]] = {
+            ConnectCommand: self.handle_connect,
+            LogoutClientCommand: self.handle_logout,
+            UpdateSpecsCommand: self.handle_update_specs,
+            GetInfoCommand: self.handle_get_info,
+            AddDriveCommand: self.handle_add_drive,
+            RemoveDriveCommand: self.handle_remove_drive,
+            ListVMsCommand: self.handle_list_vms,
+            AddVMCommand: self.handle_add_vm,
+            ListDrivesCommand: self.handle_list_drives
         }
 
-    async def handle_command(self, command: Dict[str, Any], peer_key: Optional[str] = None):
-        command_type = ManagerCommandType(command['command'])
-        handler = self.handlers.get(command_type)
-        if handler:
-            return await handler(command)
-        return DefaultResponse(status=Status.ERROR, message="Unknown command")
+    async def handle_command(self, data: bytes, peer_key: Optional[str] = None) -> BaseResponse | bytes:
+        try:
+            command = manager_commands.validate_json(data)
+        except ValidationError as e:
+            return rejected(e)
+        return await self.handlers[type(command)](command)
 
-    async def handle_connect(self, data: Dict[str, Any]) -> VMResponse:
+    async def handle_connect(self, command: ConnectCommand) -> VMResponse | bytes:
         try:
-            command = ConnectCommand(**data)
             success = await self.vm_service.connect(
                 vm_id=command.vm_id,
                 host=command.host,
@@ -54,11 +58,7 @@ class CommandHandler(CommandHandlerInterface):
                     is_connected=True,
                     last_connection=datetime.now()
                 )
-            return VMResponse(
-                status=Status.ERROR,
-                message="Connection failed",
-                is_connected=False
-            )
+            return _CONNECTION_FAILED
         except Exception as e:
             return VMResponse(
                 status=Status.ERROR,
@@ -66,9 +66,8 @@ class CommandHandler(CommandHandlerInterface):
                 is_connected=False
             )
 
-    async def handle_logout(self, data: Dict[str, Any]) -> VMResponse:
+    async def handle_logout(self, command: LogoutClientCommand) -> VMResponse:
         try:
-            command = LogoutClientCommand(**data)
             success = await self.vm_service.logout(command.vm_id)
             if success:
                 return VMResponse(
@@ -85,9 +84,8 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return VMResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_update_specs(self, data: Dict[str, Any]) -> VMResponse:
+    async def handle_update_specs(self, command: UpdateSpecsCommand) -> VMResponse:
         try:
-            command = UpdateSpecsCommand(**data)
             vm = await self.vm_service.update_info(
                 command.vm_id,
                 command.ram,
@@ -104,9 +102,8 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return VMResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_get_info(self, data: Dict[str, Any]) -> VMResponse:
+    async def handle_get_info(self, command: GetInfoCommand) -> VMResponse:
         try:
-            command = GetInfoCommand(**data)
             vm = await self.vm_service.get_info(command.vm_id)
             return VMResponse(
                 status=Status.OK,
@@ -118,9 +115,8 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return VMResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_add_drive(self, data: Dict[str, Any]) -> DriveResponse:
+    async def handle_add_drive(self, command: AddDriveCommand) -> DriveResponse:
         try:
-            command = AddDriveCommand(**data)
             vm = await self.vm_service.update_info(
                 command.vm_id,
                 None,
@@ -137,9 +133,8 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return DriveResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_list_drives(self, data: Dict[str, Any]) -> ListDrivesResponse:
+    async def handle_list_drives(self, command: ListDrivesCommand) -> ListDrivesResponse:
         try:
-            command = ListDrivesCommand(**data)
             drives = await self.vm_service.list_drives(command.vm_id)
 
             return ListDrivesResponse(
@@ -149,35 +144,21 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return ListDrivesResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_remove_drive(self, data: Dict[str, Any]) -> DriveResponse:
+    async def handle_remove_drive(self, command: RemoveDriveCommand) -> DriveResponse:
         try:
-            command = RemoveDriveCommand(**data)
-            vm = await self.vm_service.get_info(command.drive_id)
-            new_drives = [hd for hd in vm.specs.hard_drives if hd.id != command.drive_id]
-            updated_vm = await self.vm_service.update_info(
-                vm.specs.id,
-                None,
-                None,
-                new_drives
-            )
+            drives = await self.vm_service.remove_drive(vm_id=command.vm_id, drive_id=command.drive_id)
             return DriveResponse(
                 status=Status.OK,
                 drive_id=command.drive_id,
-                drives=updated_vm.specs.hard_drives,
-                vm_id=vm.specs.id
+                drives=drives,
+                vm_id=command.vm_id
             )
         except Exception as e:
             return DriveResponse(status=Status.ERROR, message=str(e))
 
-    async def handle_list_vms(self, data: Dict[str, Any]) -> VMListResponse:
+    async def handle_list_vms(self, command: ListVMsCommand) -> VMListResponse:
         try:
-            command = ListVMsCommand(**data)
-            if command.list_type == 'connected':
-                vms = await self.vm_service.get_connected()
-            elif command.list_type == 'authenticated':
-                vms = await self.vm_service.get_athenificated()
-            else:
-                vms = await self.vm_service.list_vms()
+            vms = await self.vm_service.list_vms(command.list_type or 'all')
 
             vm_responses = [
                 VMResponse(
@@ -192,10 +173,9 @@ class CommandHandler(CommandHandlerInterface):
         except Exception as e:
             return VMListResponse(status=Status.ERROR, message=str(e), vms=[])
 
-    async def handle_add_vm(self, data: Dict[str, Any]) -> VMResponse:
+    async def handle_add_vm(self, command: AddVMCommand) -> VMResponse:
         try:
-            command = AddVMCommand(**data)
-            default_drives = [HardDrive(size=4, id=0, vm_id=0)] if command.hds is None else command.hds
+            default_drives = list(_DEFAULT_DRIVES) if command.hds is None else command.hds
 
             vm = await self.vm_service.create(
                 ram=command.ram,
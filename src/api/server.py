@@ -1,85 +1,164 @@
 import asyncio
-import json
+import heapq
 import logging
-from typing import Optional, Dict, Any
+import weakref
+from typing import Optional
 
-from api.handlers.client.handler import ClientCommandHandler
-from api.handlers.server.handler import CommandHandler
-from core.protocol.base import Status
+from api.handlers.base import CommandHandlerInterface
+from core.protocol.base import BaseResponse, Status
 from core.protocol.responses import DefaultResponse
+from core.protocol.stream import (
+    OUT_BUFFER_SIZE, HEADER_SIZE, pack_frame, pack_frame_into, read_frame, tune_connection, tune_socket
+)
 import core.log_cfg
 
 logger = logging.getLogger(__name__)
 
+# (seq, encoded response) pairs handed from the handler tasks to the connection's writer task
+Reply = tuple[int, bytes]
+
 
 class VMServer:
     def __init__(
             self,
             host: str,
             port: int,
-            command_handler: CommandHandler | ClientCommandHandler):
+            command_handler: CommandHandlerInterface,
+            max_in_flight: int = 32) -> None:
         self.host = host
         self.port = port
         self.command_handler = command_handler
+        self.max_in_flight = max_in_flight
         self._server: Optional[asyncio.Server] = None
-        self._clients: Dict[asyncio.StreamWriter, asyncio.StreamReader] = {}
+        self._clients: weakref.WeakSet[asyncio.StreamWriter] = weakref.WeakSet()
 
-    async def start(self):
+    async def start(self) -> None:
         self._server = await asyncio.start_server(
             self._handle_client,
             self.host,
             self.port
         )
+        for sock in self._server.sockets:
+            tune_socket(sock)
         addr = self._server.sockets[0].getsockname()
-        logger.info(f'Server started on {addr}')
+        logger.info('Server started on %s', addr)
 
         async with self._server:
             await self._server.serve_forever()
 
-    async def stop(self):
+    async def stop(self) -> None:
         if self._server:
             self._server.close()
+
+        # Live connections are closed first: since Python 3.12 wait_closed() also waits for them
+        writers = list(self._clients)
+        for writer in writers:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for writer in writers), return_exceptions=True)
+
+        if self._server:
             await self._server.wait_closed()
             logger.info('Server stopped')
 
-        for writer in self._clients.keys():
-            writer.close()
-            await writer.wait_closed()
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Handlers and auth bookkeeping key peers by this string, so it is built once per connection
+        peer_name = str(writer.get_extra_info('peername'))
+        logger.info('New connection from %s', peer_name)
+        # Also zeroes the write buffer limits, which the reuse of the output buffer in _drain_responses relies on
+        tune_connection(writer)
+        self._clients.add(writer)
 
-    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
-        peer_name = writer.get_extra_info('peername')
-        logger.info(f'New connection from {peer_name}')
-        while True:
-            try:
-                data = await reader.read(1024)
-                if not data:
+        # Frames are read continuously and handled concurrently, a single writer task sends the results back
+        responses: asyncio.Queue[Optional[Reply]] = asyncio.Queue()
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        drainer = asyncio.create_task(self._drain_responses(writer, responses, in_flight))
+        pending: set[asyncio.Task[None]] = set()
+        seq = 0
+
+        try:
+            while True:
+                try:
+                    data = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                except ConnectionError as e:
+                    logger.warning('Dropping connection from %s: %s', peer_name, e)
                     break
-                print(f"Received data from {peer_name}: {data.decode()}")
-                message = json.loads(data.decode())
-                result = await self.command_handler.handle_command(message, peer_name)
 
-                writer.write(json.dumps(result.model_dump_json()).encode())
-                await writer.drain()
+                await in_flight.acquire()
+                task = asyncio.create_task(self._process(seq, data, peer_name, responses))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                seq += 1
 
-            except Exception as e:
-                print(f"Error handling client: {e}")
-                break
+            if pending:
+                await asyncio.gather(*pending)
+            await responses.put(None)
+            try:
+                await drainer
+            except ConnectionError as e:
+                logger.warning('Connection to %s lost: %s', peer_name, e)
+        finally:
+            drainer.cancel()
+            self._clients.discard(writer)
+            writer.close()
 
-        writer.close()
         await writer.wait_closed()
 
-    async def _send_response(self, writer: asyncio.StreamWriter, response: Any):
+    async def _process(
+            self,
+            seq: int,
+            data: bytes,
+            peer_name: str,
+            responses: asyncio.Queue[Optional[Reply]]) -> None:
+        try:
+            logger.debug("Received %d bytes from %s", len(data), peer_name)
+            result: BaseResponse | bytes = await self.command_handler.handle_command(data, peer_name)
+            # Encoded now: the response may reference state that later pipelined commands change before it is sent
+            response_bytes = result if isinstance(result, bytes) else result.to_bytes()
+        except Exception as e:
+            logger.error("Error handling command from %s: %s", peer_name, e)
+            response_bytes = DefaultResponse(status=Status.ERROR, message=str(e)).to_bytes()
+        await responses.put((seq, response_bytes))
+
+    async def _drain_responses(
+            self,
+            writer: asyncio.StreamWriter,
+            responses: asyncio.Queue[Optional[Reply]],
+            in_flight: asyncio.Semaphore) -> None:
+        # Handlers may complete out of order, so results are held back until every earlier one has been sent
+        ready: list[Reply] = []
+        next_seq = 0
+        out = bytearray(OUT_BUFFER_SIZE)
+        lost: Optional[ConnectionError] = None
+        while (item := await responses.get()) is not None:
+            heapq.heappush(ready, item)
+            while ready and ready[0][0] == next_seq:
+                _, response_bytes = heapq.heappop(ready)
+                if lost is None:
+                    try:
+                        await self._send_response(writer, response_bytes, out)
+                    except ConnectionError as e:
+                        lost = e
+                # The slot is only given back once the reply is written, so replies waiting to be sent count too.
+                # After the connection is lost replies are dropped but their slots still freed, or the reader would hang
+                in_flight.release()
+                next_seq += 1
+        if lost is not None:
+            raise lost
+
+    async def _send_response(
+            self,
+            writer: asyncio.StreamWriter,
+            response_bytes: bytes,
+            out: bytearray) -> None:
         try:
-            response_json = (
-                response.model_dump_json()
-                if hasattr(response, 'model_dump_json')
-                else json.dumps(response)
-            )
-            print(f"Sending response to client: {response_json}")
-            response_bytes = response_json.encode()
-
-            writer.write(len(response_bytes).to_bytes(4, 'big'))
-            writer.write(response_bytes)
+            logger.debug("Sending %d bytes to client", len(response_bytes))
+
+            if HEADER_SIZE + len(response_bytes) <= len(out):
+                writer.write(pack_frame_into(out, response_bytes))
+            else:
+                writer.write(pack_frame(response_bytes))
             await writer.drain()
 
         except Exception as e:
@@ -87,7 +166,6 @@ class VMServer:
             error_response = DefaultResponse(
                 status=Status.ERROR,
                 message=str(e)
-            ).model_dump_json().encode()
-            writer.write(len(error_response).to_bytes(4, 'big'))
-            writer.write(error_response)
+            ).to_bytes()
+            writer.write(pack_frame(error_response))
             await writer.drain()
@@ -1,17 +1,12 @@
 from core.protocol.requests import LogoutClientCommand
 import typer
 import asyncio
-import json
+import atexit
 from rich.table import Table
 from rich.progress import Progress
 from rich.panel import Panel
 from rich.console import Console
 
-from db.conn import DatabaseConnection
-from api.server import VMServer
-from services.server.vm_server import VMService
-from api.handlers.server.handler import CommandHandler
-from services.server.connection_manager import ConnectionManager
 from core.protocol.requests import (
     AddDriveCommand,
     ConnectCommand,
@@ -21,39 +16,78 @@ from core.protocol.requests import (
     UpdateSpecsCommand,
     ListDrivesCommand
 )
-from core.protocol.base import ManagerCommandType
+from api.handlers.base import RespT
+from core.protocol.base import BaseCommand, ManagerCommandType
+from core.protocol.stream import pack_frame, read_frame, tune_connection
 from core.protocol.base import Status
 from core.models import HardDrive, VMSpecs
-from services.client.vm_client import VMClientService
-from api.handlers.client.handler import ClientCommandHandler
 from core.protocol.responses import AuthResponse, VMListResponse, VMResponse, ListDrivesResponse
-from core.config.config import Settings
+from core.config.config import get_settings
 
-cfg = Settings()
+# Server and VM client stacks (asyncpg, services, logging setup) are imported inside the commands that run them
+cfg = get_settings()
 app = typer.Typer()
 console = Console()
-db_conn = DatabaseConnection(
-    dsn=cfg.conn_str()
-)
-auth_manager = ConnectionManager()
-vm_service = VMService(auth_manager, db_conn)
-command_handler = CommandHandler(vm_service)
 
 
-async def send_request(command: dict, host="localhost", port=cfg.port):
-    reader, writer = await asyncio.open_connection(host, port)
+def _create_command_handler():
+    from db.conn import DatabaseConnection
+    from api.handlers.server.handler import CommandHandler
+    from services.server.connection_manager import ConnectionManager
+    from services.server.vm_server import VMService
+
+    db_conn = DatabaseConnection(
+        dsn=cfg.conn_str(),
+        min_size=cfg.db.pool_min_size,
+        max_size=cfg.db.pool_max_size,
+        command_timeout=cfg.db.command_timeout
+    )
+    vm_service = VMService(ConnectionManager(), db_conn)
+    return CommandHandler(vm_service)
+
+
+class _ClientSession:
+    """One event loop and one server connection reused by every request of the CLI process"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._address: tuple[str, int] | None = None
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
 
-    request_data = json.dumps(command).encode()
-    writer.write(request_data)
-    await writer.drain()
+    async def call(self, payload: bytes, host: str, port: int) -> bytes:
+        if self._writer is None or self._writer.is_closing() or self._address != (host, port):
+            await self._disconnect()
+            self._reader, self._writer = await asyncio.open_connection(host, port)
+            tune_connection(self._writer)
+            self._address = (host, port)
 
-    response_data = await reader.read(4096)
-    response = json.loads(response_data.decode())
+        self._writer.write(pack_frame(payload))
+        await self._writer.drain()
+        return await read_frame(self._reader)
 
-    writer.close()
-    await writer.wait_closed()
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+        self._reader = self._writer = None
 
-    return json.loads(response)
+    def close(self):
+        if not self.loop.is_closed():
+            self.loop.run_until_complete(self._disconnect())
+            self.loop.close()
+
+
+_session = _ClientSession()
+atexit.register(_session.close)
+
+
+def send_request(command: BaseCommand, response_model: type[RespT], host="localhost", port=cfg.port) -> RespT:
+    data = _session.loop.run_until_complete(_session.call(command.to_bytes(), host, port))
+    return response_model.from_bytes(data)
 
 
 @app.command()
@@ -61,7 +95,9 @@ def server_start(
         host: str = typer.Option("localhost", help="Server host"),
         port: int = typer.Option(cfg.port, help="Server port"),
 ):
-    server = VMServer(host, port, command_handler)
+    from api.server import VMServer
+
+    server = VMServer(host, port, _create_command_handler())
     typer.echo(f"Starting server on {host}:{port}")
 
     try:
@@ -90,8 +126,7 @@ def connect(
         host=host,
         port=port
     )
-    result = asyncio.run(send_request(command.model_dump()))
-    result = AuthResponse(**result)
+    result = send_request(command, AuthResponse)
     if result.status == Status.OK:
         console.print("[green]Successfully connected![/green]")
     else:
@@ -106,8 +141,7 @@ def list_vms(
         list_type=list_type
     )
 
-    result = asyncio.run(send_request(command.model_dump()))
-    result = VMListResponse(**result)
+    result = send_request(command, VMListResponse)
 
     if result.status == Status.OK:
         table = Table(title="Virtual Machines")
@@ -150,8 +184,7 @@ def add_vm(
 
     with Progress() as progress:
         task = progress.add_task("[cyan]Creating VM...", total=100)
-        result = asyncio.run(send_request(command.model_dump()))
-        result = VMResponse(**result)
+        result = send_request(command, VMResponse)
         progress.update(task, completed=100)
 
         if result.status == Status.OK:
@@ -177,8 +210,7 @@ def get_info(
         vm_id=vm_id
     )
 
-    result = asyncio.run(send_request(command.model_dump()))
-    result = VMResponse(**result)
+    result = send_request(command, VMResponse)
 
     if result.status == Status.OK:
         table = Table(show_header=False, title=f"VM {vm_id} Information")
@@ -212,8 +244,7 @@ def add_drive(
 
     with Progress() as progress:
         task = progress.add_task("[cyan]Adding drive...", total=100)
-        result = asyncio.run(send_request(command.model_dump()))
-        result = VMResponse(**result)
+        result = send_request(command, VMResponse)
         progress.update(task, completed=100)
 
         if result.status == Status.OK:
@@ -239,8 +270,7 @@ def logout(vm_id: int):
     command = LogoutClientCommand(vm_id=vm_id)
 
     try:
-        result = asyncio.run(send_request(command.model_dump()))
-        result = AuthResponse(**result)
+        result = send_request(command, AuthResponse)
         if result.status == Status.OK:
             console.print("[green]Logout successful[/green]")
         else:
@@ -257,8 +287,7 @@ def update_vm(
     command = UpdateSpecsCommand(vm_id=vm_id, ram=ram, cpu=cpu)
 
     try:
-        result = asyncio.run(send_request(command.model_dump()))
-        result = VMResponse(**result)
+        result = send_request(command, VMResponse)
         if result.status == Status.OK:
             console.print("[green]VM updated successfully[/green]")
         else:
@@ -272,8 +301,7 @@ def list_drives(vm_id: int | None = None):
     command = ListDrivesCommand(vm_id=vm_id)
 
     try:
-        result = asyncio.run(send_request(command.model_dump()))
-        result = ListDrivesResponse(**result)
+        result = send_request(command, ListDrivesResponse)
         if result.status == Status.OK:
             table = Table(title="Discs")
             table.add_column("ID", justify="right", style="cyan")
@@ -296,8 +324,7 @@ def update_hd(vm_id: int, volume: int, id: int = 0):
     command = UpdateSpecsCommand(vm_id=vm_id, ram=None, cpu=None, hds=[hd])
 
     try:
-        result = asyncio.run(send_request(command.model_dump()))
-        result = VMResponse(**result)
+        result = send_request(command, VMResponse)
         if result.status == Status.OK:
             console.print(f"[green]Drive updated successfully[/green]")
         else:
@@ -318,6 +345,10 @@ def start_client(
         cpu: int = typer.Option(1, help="Количестыо ядер"),
         port: int = typer.Option(..., help="Порт для подключения"),
         drives: list[int] = typer.Option(None, help="Список объемов жестких дисков в GB")):
+    from api.server import VMServer
+    from api.handlers.client.handler import ClientCommandHandler
+    from services.client.vm_client import VMClientService
+
     initial_specs = VMSpecs(
         id=0,
         ram=ram,
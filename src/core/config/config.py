@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -11,6 +12,10 @@ class DB(BaseModel):
     name: str = 'red_vm'
     host: str = '0.0.0.0'
     port: int = 5432
+    # Connection pool
+    pool_min_size: int = 10
+    pool_max_size: int = 50
+    command_timeout: float = 60
 
 
 class Settings(BaseSettings):
@@ -25,3 +30,8 @@ class Settings(BaseSettings):
 
     def conn_str(self):
         return f"postgresql://{self.db.user}:{self.db.password}@{self.db.host}:{self.db.port}/{self.db.name}"
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    return Settings()
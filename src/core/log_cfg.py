@@ -1,12 +1,29 @@
-import json
+import atexit
 import logging
-from datetime import datetime
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+import orjson
 
 
 class JsonFormatter(logging.Formatter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Records come in bursts: the date/time part is formatted once per second and only milliseconds are appended
+        self._last_sec = -1
+        self._last_prefix = ""
+
+    def _timestamp(self, created: float) -> str:
+        sec = int(created)
+        if sec != self._last_sec:
+            self._last_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(sec))
+            self._last_sec = sec
+        return f"{self._last_prefix}.{int((created - sec) * 1000):03d}"
+
     def format(self, record):
         log_record = {
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": self._timestamp(record.created),
             "level": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
@@ -16,7 +33,15 @@ class JsonFormatter(logging.Formatter):
         }
         if record.exc_info:
             log_record["exception"] = self.formatException(record.exc_info)
-        return json.dumps(log_record)
+        return orjson.dumps(log_record).decode()
+
+
+class LocalQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The queue never leaves the process: only freeze the message and keep exc_info for JsonFormatter
+        record.msg = record.getMessage()
+        record.args = None
+        return record
 
 
 def setup_global_json_logging():
@@ -26,9 +51,15 @@ def setup_global_json_logging():
     handler = logging.StreamHandler()
     handler.setFormatter(JsonFormatter())
 
+    # Records are formatted and written by the listener thread so logging never blocks the event loop
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+
     logger.handlers.clear()
 
-    logger.addHandler(handler)
+    logger.addHandler(LocalQueueHandler(log_queue))
 
 
 setup_global_json_logging()
@@ -1,11 +1,15 @@
 import asyncio
-import json
+import logging
+from collections import deque
 from datetime import datetime
-from typing import List, Optional
+from typing import Deque, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
-from core.protocol.base import BaseCommand
+from core.protocol.base import BaseCommand, BaseResponse
+from core.protocol.stream import pack_frame, read_frame
+
+logger = logging.getLogger(__name__)
 
 
 class VMConnection(BaseModel):
@@ -13,7 +17,15 @@ class VMConnection(BaseModel):
     writer: Optional[asyncio.StreamWriter] = None
     is_authenticated: bool = False
 
+    # The VM answers in request order, so replies are matched to the oldest waiting request
+    _replies: Deque[asyncio.Future] = PrivateAttr(default_factory=deque)
+    _reader_task: Optional[asyncio.Task] = PrivateAttr(None)
+
     async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._fail_pending(ConnectionError("Connection closed"))
         if self.writer and not self.writer.is_closing():
             self.writer.close()
             await self.writer.wait_closed()
@@ -21,23 +33,54 @@ class VMConnection(BaseModel):
         self.writer = None
         self.is_authenticated = False
 
-    async def send_command(self, command: BaseCommand) -> dict:
+    async def send_command(self, command: BaseCommand | bytes) -> BaseResponse:
         if not self.writer or not self.reader:
             raise ConnectionError("No active connection")
-
-        self.writer.write(command.model_dump_json().encode())
-        await self.writer.drain()
-
-        data = await self.reader.read(4096)
-
-        if not data:
-            raise ValueError("No data received from the server")
-
-        decoded_data = data.decode("utf-8")
+        if self._reader_task is None:
+            self._reader_task = asyncio.create_task(self._read_replies(self.reader))
+        elif self._reader_task.done():
+            raise ConnectionError("Connection to the VM was lost")
+
+        # Commands without parameters may be passed already serialized. The frame is built before the reply is
+        # queued, a command that fails to encode must not take the place of the next reply
+        frame = pack_frame(command if isinstance(command, bytes) else command.to_bytes())
+
+        # Several commands may be in flight at once, each one just waits for its own reply
+        reply = asyncio.get_running_loop().create_future()
+        self._replies.append(reply)
+        try:
+            self.writer.write(frame)
+            await self.writer.drain()
+        except BaseException:
+            reply.cancel()
+            raise
+        data = await reply
+
+        # Only status and message are read from replies, any other field is skipped without being validated.
+        # Malformed replies raise pydantic's ValidationError, which is a ValueError
+        return BaseResponse.from_bytes(data)
+
+    async def _read_replies(self, reader: asyncio.StreamReader):
         try:
-            return json.loads(decoded_data)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Invalid JSON received: {decoded_data}") from e
+            while True:
+                data = await read_frame(reader)
+                if not self._replies:
+                    logger.warning("Dropping unsolicited reply from VM")
+                    continue
+                reply = self._replies.popleft()
+                # The caller may have given up waiting, the reply is consumed anyway to keep the order
+                if not reply.done():
+                    reply.set_result(data)
+        except asyncio.IncompleteReadError:
+            self._fail_pending(ValueError("No data received from the server"))
+        except Exception as e:
+            self._fail_pending(e)
+
+    def _fail_pending(self, error: Exception):
+        while self._replies:
+            reply = self._replies.popleft()
+            if not reply.done():
+                reply.set_exception(error)
 
     model_config = {
         "arbitrary_types_allowed": True
@@ -1,44 +1,63 @@
-from enum import Enum
-from typing import Optional
+from enum import Enum, IntEnum
+from typing import Optional, Self
 
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel, ConfigDict
 
 
-class Status(Enum):
-    OK = 'ok'
-    ERROR = 'error'
+# Wire tags are small integers: shorter frames than the names and serialized natively by pydantic-core
+class Status(IntEnum):
+    OK = 1
+    ERROR = 2
 
 
-class ManagerCommandType(Enum):
-    CONNECT = 'connect'
-    LOGOUT = 'logout'
-    UPDATE_SPECS = 'update_specs'
-    GET_INFO = 'get_info'
-    ADD_DRIVE = 'add_drive'
-    REMOVE_DRIVE = 'remove_drive'
-    LIST_VMS = 'list_vms'
-    LIST_DRIVES = 'list_drives'
-    ADD_VM = 'add_vm'
+class ManagerCommandType(IntEnum):
+    CONNECT = 1
+    LOGOUT = 2
+    UPDATE_SPECS = 3
+    GET_INFO = 4
+    ADD_DRIVE = 5
+    REMOVE_DRIVE = 6
+    LIST_VMS = 7
+    LIST_DRIVES = 8
+    ADD_VM = 9
 
 
-class ClientCommandType(Enum):
-    AUTH = 'auth'
-    LOGOUT = 'logout'
-    UPDATE = 'update'
+class ClientCommandType(IntEnum):
+    AUTH = 1
+    LOGOUT = 2
+    UPDATE = 3
 
 
 class BaseCommand(BaseModel):
+    # Messages are never modified after construction, which also makes shared instances safe to reuse
+    model_config = ConfigDict(frozen=True)
+
     command: Enum
 
-    @field_serializer('command')
-    def serialize_enum(self, command: Enum) -> str:
-        return command.value
+    def params(self) -> dict:
+        # Field values without the command tag. Nested models stay models, unlike model_dump()
+        return {name: value for name, value in self if name != 'command'}
+
+    # to_bytes()/from_bytes() are the only places that know the wire encoding
+    def to_bytes(self) -> bytes:
+        return self.__pydantic_serializer__.to_json(self)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Self:
+        return cls.model_validate_json(data)
 
 
 class BaseResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     status: Status
     message: Optional[str] = None
 
-    @field_serializer('status')
-    def serialize_enum(self, command: Enum) -> str:
-        return command.value
+    def to_bytes(self) -> bytes:
+        # Goes straight to pydantic-core, skipping the model_dump_json() wrapper and a str -> bytes encode
+        return self.__pydantic_serializer__.to_json(self)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Self:
+        # Parsed and validated in one pass by pydantic-core, no intermediate dict
+        return cls.model_validate_json(data)
@@ -1,6 +1,6 @@
-from typing import Optional, List
+from typing import Optional, List, Literal, Union, Annotated
 
-from pydantic import Field
+from pydantic import Field, TypeAdapter
 
 from core.models import HardDrive
 from core.protocol.base import BaseCommand
@@ -10,7 +10,7 @@ from core.protocol.base import ManagerCommandType
 
 # -------------------Server-------------------
 class ConnectCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.CONNECT
+    command: Literal[ManagerCommandType.CONNECT] = ManagerCommandType.CONNECT
     vm_id: int
     username: str
     password: str
@@ -19,12 +19,12 @@ class ConnectCommand(BaseCommand):
 
 
 class LogoutClientCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.LOGOUT
+    command: Literal[ManagerCommandType.LOGOUT] = ManagerCommandType.LOGOUT
     vm_id: int
 
 
 class UpdateSpecsCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.UPDATE_SPECS
+    command: Literal[ManagerCommandType.UPDATE_SPECS] = ManagerCommandType.UPDATE_SPECS
     vm_id: int
     ram: Optional[int] = Field(None, gt=0)
     cpu: Optional[int] = Field(None, gt=0)
@@ -32,33 +32,34 @@ class UpdateSpecsCommand(BaseCommand):
 
 
 class GetInfoCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.GET_INFO
+    command: Literal[ManagerCommandType.GET_INFO] = ManagerCommandType.GET_INFO
     vm_id: int
 
 
 class AddDriveCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.ADD_DRIVE
+    command: Literal[ManagerCommandType.ADD_DRIVE] = ManagerCommandType.ADD_DRIVE
     vm_id: int
     size: int = Field(1, gt=0)
 
 
 class RemoveDriveCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.REMOVE_DRIVE
+    command: Literal[ManagerCommandType.REMOVE_DRIVE] = ManagerCommandType.REMOVE_DRIVE
+    vm_id: int
     drive_id: int
 
 
 class ListVMsCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.LIST_VMS
+    command: Literal[ManagerCommandType.LIST_VMS] = ManagerCommandType.LIST_VMS
     list_type: Optional[str] = 'all'
 
 
 class ListDrivesCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.LIST_DRIVES
+    command: Literal[ManagerCommandType.LIST_DRIVES] = ManagerCommandType.LIST_DRIVES
     vm_id: int | None = None
 
 
 class AddVMCommand(BaseCommand):
-    command: ManagerCommandType = ManagerCommandType.ADD_VM
+    command: Literal[ManagerCommandType.ADD_VM] = ManagerCommandType.ADD_VM
     ram: int = Field(1, gt=0)
     cpu: int = Field(1, gt=0)
     hds: Optional[List[HardDrive]] = None
@@ -66,7 +67,7 @@ class AddVMCommand(BaseCommand):
 
 # ------------------- Client -----------------
 class AuthCommand(BaseCommand):
-    command: ClientCommandType = ClientCommandType.AUTH
+    command: Literal[ClientCommandType.AUTH] = ClientCommandType.AUTH
     vm_id: int
     username: str
     password: str
@@ -74,7 +75,7 @@ class AuthCommand(BaseCommand):
 
 # TODO: For the future mostly... In this iteration is for updating ID on cleient
 class UpdateClientSpecs(BaseCommand):
-    command: ClientCommandType = ClientCommandType.UPDATE
+    command: Literal[ClientCommandType.UPDATE] = ClientCommandType.UPDATE
     id: Optional[int] = 0
     ram: Optional[int] = Field(1, gt=0)
     cpu: Optional[int] = Field(1, gt=0)
@@ -82,4 +83,22 @@ class UpdateClientSpecs(BaseCommand):
 
 
 class LogoutCommand(BaseCommand):
-    command: ClientCommandType = ClientCommandType.LOGOUT
+    command: Literal[ClientCommandType.LOGOUT] = ClientCommandType.LOGOUT
+
+
+# Inbound commands are parsed straight from the frame bytes, the "command" tag selects the model in pydantic-core
+ManagerCommand = Annotated[
+    Union[
+        ConnectCommand, LogoutClientCommand, UpdateSpecsCommand,
+        GetInfoCommand, AddDriveCommand, RemoveDriveCommand,
+        ListVMsCommand, ListDrivesCommand, AddVMCommand
+    ],
+    Field(discriminator='command')
+]
+ClientCommand = Annotated[
+    Union[AuthCommand, UpdateClientSpecs, LogoutCommand],
+    Field(discriminator='command')
+]
+
+manager_commands: TypeAdapter[ManagerCommand] = TypeAdapter(ManagerCommand)
+client_commands: TypeAdapter[ClientCommand] = TypeAdapter(ClientCommand)
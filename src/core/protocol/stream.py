@@ -0,0 +1,51 @@
+import asyncio
+import socket
+import struct
+
+# Every message on the wire is prefixed with its length as a 4-byte big-endian integer
+HEADER = struct.Struct('>I')
+HEADER_SIZE = HEADER.size
+SOCKET_BUFFER_SIZE = 256 * 1024
+# Per-connection scratch space for outgoing frames, larger responses fall back to pack_frame
+OUT_BUFFER_SIZE = 64 * 1024
+# Larger length prefixes are refused instead of buffered, the header alone could otherwise ask for 4 GiB
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def pack_frame(payload: bytes) -> bytes:
+    return HEADER.pack(len(payload)) + payload
+
+
+def pack_frame_into(buf: bytearray, payload: bytes) -> memoryview:
+    # The caller must not touch buf again until the returned view has been fully flushed
+    end = HEADER_SIZE + len(payload)
+    HEADER.pack_into(buf, 0, len(payload))
+    buf[HEADER_SIZE:end] = payload
+    return memoryview(buf)[:end]
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    header = await reader.readexactly(HEADER_SIZE)
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        # The payload is left unread, so the stream can't be resynchronised and the connection has to be dropped
+        raise ConnectionError(f"Frame of {size} bytes exceeds the {MAX_FRAME_SIZE} byte limit")
+    return await reader.readexactly(size)
+
+
+def tune_socket(sock: socket.socket) -> None:
+    # Small request/response messages: flush immediately instead of waiting for Nagle coalescing
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+    if hasattr(socket, 'TCP_QUICKACK'):
+        # Linux only: ACK replies right away instead of delaying them. The kernel may fall back to delayed ACKs later
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+
+def tune_connection(writer: asyncio.StreamWriter) -> None:
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        tune_socket(sock)
+    # drain() then waits until everything is handed to the kernel instead of returning with data still queued
+    writer.transport.set_write_buffer_limits(0)
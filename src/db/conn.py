@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from typing import Optional, AsyncGenerator
@@ -11,15 +12,45 @@ logger = logging.getLogger(__name__)
 
 
 class DatabaseConnection:
-    def __init__(self, dsn: str):
+    def __init__(
+            self,
+            dsn: str,
+            min_size: int = 10,
+            max_size: int = 50,
+            statement_cache_size: int = 256,
+            command_timeout: float = 60):
         self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.command_timeout = command_timeout
+        # asyncpg prepares every parametrized query once per connection and reuses the plan from this LRU cache
+        self.statement_cache_size = statement_cache_size
         self.pool: Optional[Pool] = None
+        # Requests arriving before the pool exists would otherwise each create one and leak all but the last
+        self._connect_lock = asyncio.Lock()
 
     async def connect(self) -> Pool:
-        if not self.pool:
-            self.pool = await asyncpg.create_pool(self.dsn)
-            async with self.pool.acquire() as conn:
+        if self.pool:
+            return self.pool
+        async with self._connect_lock:
+            if self.pool:
+                return self.pool
+            pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                statement_cache_size=self.statement_cache_size,
+                command_timeout=self.command_timeout,
+                # Recycle connections periodically and close the ones idle for 5 minutes
+                max_queries=50_000,
+                max_inactive_connection_lifetime=300,
+                # Only short OLTP queries are run, JIT compilation would cost more than it saves
+                server_settings={'jit': 'off'}
+            )
+            async with pool.acquire() as conn:
                 await self._create_tables(conn)
+            # Published only once the tables exist, so transaction() never sees a half-initialized pool
+            self.pool = pool
         return self.pool
 
     async def disconnect(self) -> None:
@@ -56,3 +87,13 @@ class DatabaseConnection:
             uow = UnitOfWork(connection)
             async with uow as unit:
                 yield unit
+
+    @asynccontextmanager
+    async def read(self) -> AsyncGenerator[UnitOfWork, None]:
+        # For SELECT-only work: each statement runs in its own implicit transaction, saving the BEGIN and COMMIT
+        if not self.pool:
+            logger.error("Not connected to database")
+            raise RuntimeError("Not connected to database")
+
+        async with self.pool.acquire() as connection:
+            yield UnitOfWork(connection)
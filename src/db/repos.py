@@ -1,10 +1,10 @@
-from datetime import datetime
-from typing import Optional, Any, Dict, List
+from typing import Dict, Optional, List
 
+from asyncpg import Record
 from asyncpg.connection import Connection
 
 
-# TODO: Mapping in models instead of dict
+# Rows are returned as asyncpg Records, which support the same row['column'] access as a dict without copying
 class VirtualMachineRepository:
     def __init__(self, connection: Connection):
         self.connection = connection
@@ -16,13 +16,46 @@ class VirtualMachineRepository:
         )
         return vm_id
 
-    async def get(self, vm_id: int) -> Optional[Dict[str, Any]]:
-        row = await self.connection.fetchrow('SELECT * FROM virtual_machines WHERE id = $1', vm_id)
-        return dict(row) if row else None
+    async def get(self, vm_id: int) -> Optional[Record]:
+        return await self.connection.fetchrow('SELECT * FROM virtual_machines WHERE id = $1', vm_id)
 
-    async def update(self, vm_id: int, ram: int, cpu: int) -> None:
-        await self.connection.execute(
-            'UPDATE virtual_machines SET ram = $2, cpu = $3 WHERE id = $1',
+    async def get_many(self, vm_ids: List[int]) -> List[Record]:
+        return await self.connection.fetch('SELECT * FROM virtual_machines WHERE id = ANY($1::int[])', vm_ids)
+
+    async def get_with_drives(self, vm_id: int) -> Optional[Record]:
+        # The VM row plus its drives as a JSON array in "hds", fetched in one round-trip
+        return await self.connection.fetchrow(
+            '''
+            SELECT vm.*, COALESCE(
+                json_agg(json_build_object('id', hd.id, 'size', hd.size, 'vm_id', hd.vm_id) ORDER BY hd.id)
+                    FILTER (WHERE hd.id IS NOT NULL),
+                '[]'
+            ) AS hds
+            FROM virtual_machines vm
+            LEFT JOIN hard_drives hd ON hd.vm_id = vm.id
+            WHERE vm.id = $1
+            GROUP BY vm.id
+            ''',
+            vm_id
+        )
+
+    async def update(self, vm_id: int, ram: Optional[int], cpu: Optional[int]) -> Optional[Record]:
+        # None keeps the stored value. Returns the updated row with its drives in "hds" like get_with_drives(),
+        # or None if there is no such VM
+        return await self.connection.fetchrow(
+            '''
+            UPDATE virtual_machines vm
+            SET ram = COALESCE($2, vm.ram), cpu = COALESCE($3, vm.cpu)
+            WHERE vm.id = $1
+            RETURNING vm.*, (
+                SELECT COALESCE(
+                    json_agg(json_build_object('id', hd.id, 'size', hd.size, 'vm_id', hd.vm_id) ORDER BY hd.id),
+                    '[]'
+                )
+                FROM hard_drives hd
+                WHERE hd.vm_id = vm.id
+            ) AS hds
+            ''',
             vm_id, ram, cpu
         )
 
@@ -30,25 +63,27 @@ class VirtualMachineRepository:
         await self.connection.execute(
             '''
             UPDATE virtual_machines
-            SET last_connected = $2
+            SET last_connected = LOCALTIMESTAMP
             WHERE id = $1
             ''',
-            vm_id, datetime.now()
+            vm_id
         )
 
-    async def get_all(self) -> List[Dict[str, Any]]:
-        rows = await self.connection.fetch('SELECT * FROM virtual_machines')
-        return [dict(row) for row in rows]
+    async def delete(self, vm_id: int) -> bool:
+        # hard_drives rows referencing the VM are removed by the foreign key's ON DELETE CASCADE
+        status = await self.connection.execute('DELETE FROM virtual_machines WHERE id = $1', vm_id)
+        return status == 'DELETE 1'
+
+    async def get_all(self) -> List[Record]:
+        return await self.connection.fetch('SELECT * FROM virtual_machines')
 
-    async def get_connected(self) -> List[Dict[str, Any]]:
-        rows = await self.connection.fetch('SELECT * FROM virtual_machines WHERE is_connected = true')
-        return [dict(row) for row in rows]
+    async def get_connected(self) -> List[Record]:
+        return await self.connection.fetch('SELECT * FROM virtual_machines WHERE is_connected = true')
 
 
 # ------ HardDrive -------
 
 
-# TODO: Mapping in models instead of dict
 class HardDriveRepository:
     def __init__(self, connection: Connection):
         self.connection = connection
@@ -60,26 +95,88 @@ class HardDriveRepository:
         )
         return drive_id
 
+    async def add_many(self, vm_id: int, sizes: List[int]) -> List[Record]:
+        # The whole batch in one statement, returning the new rows so callers need no follow-up SELECT
+        return await self.connection.fetch(
+            '''
+            WITH added AS (
+                INSERT INTO hard_drives (vm_id, size)
+                SELECT $1, size FROM unnest($2::int[]) AS size
+                RETURNING id, size, vm_id
+            )
+            SELECT * FROM added ORDER BY id
+            ''',
+            vm_id, sizes
+        )
+
     async def remove(self, drive_id: int) -> None:
         await self.connection.execute('DELETE FROM hard_drives WHERE id = $1', drive_id)
 
-    async def get_for_vm(self, vm_id: int) -> List[Dict[str, Any]]:
-        rows = await self.connection.fetch('SELECT * FROM hard_drives WHERE vm_id = $1', vm_id)
-        return [dict(row) for row in rows]
+    async def remove_and_list(self, vm_id: int, drive_id: int) -> Record:
+        # One row whatever is left: whether the drive was found and the remaining drives as a JSON array.
+        # The outer SELECT sees the table as it was before the DELETE, so the removed row is filtered out explicitly
+        return await self.connection.fetchrow(
+            '''
+            WITH removed AS (
+                DELETE FROM hard_drives WHERE id = $2 AND vm_id = $1 RETURNING id
+            )
+            SELECT
+                EXISTS(SELECT 1 FROM removed) AS removed,
+                COALESCE(
+                    json_agg(json_build_object('id', id, 'size', size, 'vm_id', vm_id) ORDER BY id),
+                    '[]'
+                ) AS hds
+            FROM hard_drives
+            WHERE vm_id = $1 AND id NOT IN (SELECT id FROM removed)
+            ''',
+            vm_id, drive_id
+        )
+
+    async def get_for_vm(self, vm_id: int) -> List[Record]:
+        return await self.connection.fetch('SELECT * FROM hard_drives WHERE vm_id = $1', vm_id)
+
+    async def list_json(self, vm_id: Optional[int] = None) -> str:
+        # All drives, or those of one VM, as a single JSON array that pydantic parses in one call
+        query = '''
+            SELECT COALESCE(
+                json_agg(json_build_object('id', id, 'size', size, 'vm_id', vm_id) ORDER BY id),
+                '[]'
+            )
+            FROM hard_drives
+        '''
+        if vm_id is None:
+            return await self.connection.fetchval(query)
+        return await self.connection.fetchval(query + 'WHERE vm_id = $1', vm_id)
+
+    async def get_for_vms(self, vm_ids: List[int]) -> List[Record]:
+        return await self.connection.fetch(
+            'SELECT id, size, vm_id FROM hard_drives WHERE vm_id = ANY($1::int[]) ORDER BY id',
+            vm_ids
+        )
 
     async def update(self, drive_id: int, size: int) -> None:
         print(f"Updating drive {drive_id} to size {size}")
         await self.connection.execute('UPDATE hard_drives SET size = $1 WHERE id = $2', size, drive_id)
 
+    async def update_many(self, vm_id: int, sizes: Dict[int, int]) -> None:
+        # New sizes keyed by drive id, applied in one statement; drives of other VMs are left alone
+        await self.connection.execute(
+            '''
+            UPDATE hard_drives hd SET size = u.size
+            FROM unnest($2::int[], $3::int[]) AS u(id, size)
+            WHERE hd.id = u.id AND hd.vm_id = $1
+            ''',
+            vm_id, list(sizes), list(sizes.values())
+        )
+
     async def create_or_update(self):
         ...
 
-    async def get_all(self) -> List[Dict[str, Any]]:
-        rows = await self.connection.fetch(
+    async def get_all(self) -> List[Record]:
+        return await self.connection.fetch(
             '''
             SELECT hd.*, vm.ram, vm.cpu
             FROM hard_drives hd
             LEFT JOIN virtual_machines vm ON hd.vm_id = vm.id
             '''
         )
-        return [dict(row) for row in rows]
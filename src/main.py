@@ -1,3 +1,14 @@
+import asyncio
+
+try:
+    import uvloop
+except ImportError:
+    # uvloop is optional (not available on Windows), the stock asyncio loop is used instead
+    pass
+else:
+    # Must be set before the CLI is imported: it creates its client event loop at import time
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 from cli.app import app
 
 
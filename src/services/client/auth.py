@@ -7,6 +7,7 @@ logger = logging.getLogger(__name__)
 
 
 class AuthClientServiceBase(ABC):
+    # Peers are keyed by the string VMServer builds once per connection, so lookups need no conversion
     authorized_servers: set[str]
 
     @abstractmethod
@@ -29,18 +30,17 @@ class AuthClientService(AuthClientServiceBase):
         self.authorized_servers = authorized_servers
 
     async def authenticate(self, username: str, password: str, peer: str) -> bool:
-        logger.info(f"Authenticating {username} from {peer}")
+        logger.info("Authenticating %s from %s", username, peer)
         if check := username == self.username and self.password == password:
-            self.authorized_servers.add(str(peer))
-        logging.log(logging.INFO, f"Authorization status: {check}")
+            self.authorized_servers.add(peer)
+        logger.info("Authorization status: %s", check)
         return check
 
     async def is_authorized(self, peer: str) -> bool:
-        logging.log(logging.INFO, f"Checking authorization for {peer}")
-        logging.log(logging.DEBUG, f"Authorized hosts: {self.authorized_servers}")
-        return str(peer) in self.authorized_servers
+        logger.debug("Checking authorization for %s", peer)
+        logger.debug("Authorized hosts: %s", self.authorized_servers)
+        return peer in self.authorized_servers
 
     async def remove_authorization(self, peer: str):
-        logging.log(logging.INFO, f"Removing authorization for {peer}")
-        if str(peer) in self.authorized_servers:
-            self.authorized_servers.remove(str(peer))
+        logger.info("Removing authorization for %s", peer)
+        self.authorized_servers.discard(peer)
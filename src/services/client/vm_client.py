@@ -74,23 +74,22 @@ class VMClientService(VMClientServiceBase):
             if self.specs.id == 0:
                 self.specs.id = vm_id
             if self.specs.id != vm_id:
-                logger.warn(f"VM ID[{vm_id}] mismatch for {self.specs}")
+                logger.warning("VM ID[%s] mismatch for %s", vm_id, self.specs)
                 return False
             if is_authenticated:
-                logger.info(f"Server {peer_key} successfully authenticated")
+                logger.info("Server %s successfully authenticated", peer_key)
             else:
-                logger.warning(f"Authentication failed for {peer_key}")
-            print(f'authorized servers: {self.auth_manager.authorized_servers}')
+                logger.warning("Authentication failed for %s", peer_key)
             return is_authenticated
 
         except Exception as e:
-            logger.error(f"Authentication error for {peer_key}: {e}")
+            logger.error("Authentication error for %s: %s", peer_key, e)
             return False
 
     async def get_info(self, peer_key: str) -> VMSpecs | None:
-        logger.info(f"Sending info to {peer_key}")
+        logger.info("Sending info to %s", peer_key)
         if not await self.auth_manager.is_authorized(peer_key):
-            logger.warning(f"Unauthorized access attempt from {peer_key}")
+            logger.warning("Unauthorized access attempt from %s", peer_key)
             return None
         return self.specs
 
@@ -101,9 +100,9 @@ class VMClientService(VMClientServiceBase):
             ram: int | None = None,
             cpu: int | None = None,
             hds: List[HardDrive] | None = None) -> bool:
-        logger.info(f"Sending info to {peer_key}")
+        logger.info("Sending info to %s", peer_key)
         if not await self.auth_manager.is_authorized(peer_key):
-            logger.warning(f"Unauthorized update attempt from {peer_key}")
+            logger.warning("Unauthorized update attempt from %s", peer_key)
             return False
 
         try:
@@ -124,14 +123,13 @@ class VMClientService(VMClientServiceBase):
             return True
 
         except Exception as e:
-            logger.error(f"Error updating specs: {e}")
+            logger.error("Error updating specs: %s", e)
             return False
 
     async def logout(self, peer_key: str) -> bool:
-        print(f'authorized servers: {self.auth_manager.authorized_servers}')
-        print(peer_key + " try to logout")
+        logger.debug("%s tries to log out, authorized servers: %s", peer_key, self.auth_manager.authorized_servers)
         if peer_key in self.auth_manager.authorized_servers:
-            print("Successfully logged out")
             self.auth_manager.authorized_servers.remove(peer_key)
+            logger.info("%s logged out", peer_key)
             return True
         return False
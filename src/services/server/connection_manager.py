@@ -1,15 +1,18 @@
 import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from core.models import VM, VMConnection
+from core.protocol.base import Status
 from core.protocol.requests import AuthCommand, LogoutCommand
-import json
+from core.protocol.stream import tune_connection
 import core.log_cfg
 
 logger = logging.getLogger(__name__)
 
+_LOGOUT = LogoutCommand().to_bytes()
+
 
 class ConnectionManagerBase(ABC):
     _connected_vms: Dict[int, VM]
@@ -21,6 +24,19 @@ class ConnectionManagerBase(ABC):
                       port: int) -> VMConnection:
         pass
 
+    @abstractmethod
+    async def connect_and_authenticate(self,
+                                       vm_id: int,
+                                       host: str,
+                                       port: int,
+                                       username: str,
+                                       password: str) -> Optional[VMConnection]:
+        pass
+
+    @abstractmethod
+    async def release(self, vm_id: int, connection: VMConnection) -> None:
+        pass
+
     @abstractmethod
     async def logout(self, vm_id: int) -> bool:
         pass
@@ -48,13 +64,38 @@ class ConnectionManager(ConnectionManagerBase):
                       port: int) -> VMConnection:
         try:
             reader, writer = await asyncio.open_connection(host, port)
+            tune_connection(writer)
             connection = VMConnection(reader=reader, writer=writer)
             self._connected_vms[vm_id] = connection
             return connection
         except Exception as e:
-            logger.error(f"Failed to connect to VM {vm_id}: {e}")
+            logger.error("Failed to connect to VM %s: %s", vm_id, e)
             raise ConnectionError(f"Failed to connect to VM {vm_id}: {e}")
 
+    async def connect_and_authenticate(self,
+                                       vm_id: int,
+                                       host: str,
+                                       port: int,
+                                       username: str,
+                                       password: str) -> Optional[VMConnection]:
+        # The whole handshake as one awaitable, so callers can overlap it with other work.
+        # A rejected or failed attempt leaves no connection behind; None means the credentials were refused
+        connection = await self.connect(vm_id, host, port)
+        try:
+            if await self.authenticate(vm_id, username, password):
+                return connection
+        except BaseException:
+            await self.release(vm_id, connection)
+            raise
+        await self.release(vm_id, connection)
+        return None
+
+    async def release(self, vm_id: int, connection: VMConnection) -> None:
+        # Closes the connection and forgets it, unless the VM has been reconnected with another one since
+        if self._connected_vms.get(vm_id) is connection:
+            del self._connected_vms[vm_id]
+        await connection.close()
+
     async def disconnect(self, vm: VM) -> bool:
         if not vm.connection:
             return False
@@ -65,7 +106,7 @@ class ConnectionManager(ConnectionManagerBase):
             vm.connection = None
             return True
         except Exception as e:
-            logger.error(f"Error disconnecting VM {vm.specs.id}: {e}")
+            logger.error("Error disconnecting VM %s: %s", vm.specs.id, e)
             return False
 
     async def authenticate(self, vm_id: int, username: str, password: str) -> bool:
@@ -75,13 +116,12 @@ class ConnectionManager(ConnectionManagerBase):
 
         r = AuthCommand(vm_id=vm_id, username=username, password=password)
         auth_result = await vm.send_command(r)
-        auth_result = json.loads(auth_result)
-        if auth_result['status'] == 'ok':
+        if auth_result.status == Status.OK:
             vm.is_authenticated = True
-            logger.info(f"VM {vm_id} authenticated")
+            logger.info("VM %s authenticated", vm_id)
             return True
-        if auth_result['status'] == 'error':
-            logger.error(f"VM {vm_id} authentication failed")
+        if auth_result.status == Status.ERROR:
+            logger.error("VM %s authentication failed", vm_id)
             return False
         return False
 
@@ -90,14 +130,11 @@ class ConnectionManager(ConnectionManagerBase):
         if not vm:
             raise ConnectionError("VM not connected")
 
-        r = LogoutCommand()
-
-        logout_result = await vm.send_command(r)
-        logout_result = json.loads(logout_result)
+        logout_result = await vm.send_command(_LOGOUT)
 
-        if logout_result['status'] == 'ok':
+        if logout_result.status == Status.OK:
             vm.is_authenticated = False
-            logger.info(f"VM {vm_id} logged out")
+            logger.info("VM %s logged out", vm_id)
             return True
         return False
 
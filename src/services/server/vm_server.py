@@ -1,17 +1,26 @@
+import asyncio
 import logging
+import weakref
 from abc import ABC, abstractmethod
+from collections import OrderedDict, defaultdict
 from datetime import datetime
-from typing import List, Dict
+from typing import DefaultDict, List, Dict, Tuple
 from typing import Optional
 
+from pydantic import TypeAdapter
+
 from core.models import HardDrive, VM, VMSpecs
 from db.conn import DatabaseConnection
 from services.server.connection_manager import ConnectionManagerBase
+from core.protocol.base import Status
 from core.protocol.requests import UpdateClientSpecs
-import json
 
 logger = logging.getLogger(__name__)
 
+# Parses drive lists aggregated to JSON by the database (get_with_drives(), list_json(), remove_and_list())
+# straight into models
+_drives_adapter = TypeAdapter(List[HardDrive])
+
 
 class VMServiceBase(ABC):
     auth_manager: ConnectionManagerBase
@@ -64,11 +73,27 @@ class VMServiceBase(ABC):
         pass
 
     @abstractmethod
-    async def list_vms(self) -> List[VM]:
-        """Get list of all VMs
+    async def remove_drive(self, vm_id: int, drive_id: int) -> List[HardDrive]:
+        """Remove a hard drive from a VM
+
+        Args:
+            vm_id (int): ID of VM the drive belongs to
+            drive_id (int): ID of drive to remove
 
         Returns:
-            List[VMSpecs]: List of all VM specifications
+            List[HardDrive]: Drives left on the VM
+        """
+        pass
+
+    @abstractmethod
+    async def list_vms(self, list_type: str = 'all') -> List[VM]:
+        """Get list of VMs
+
+        Args:
+            list_type (str): Which VMs to return: all, connected or authenticated
+
+        Returns:
+            List[VMSpecs]: List of VM specifications
         """
         pass
 
@@ -135,12 +160,49 @@ class VMServiceBase(ABC):
 
 
 class VMService(VMServiceBase):
-    def __init__(self, auth_manager: ConnectionManagerBase, db_conn: DatabaseConnection):
+    def __init__(
+            self,
+            auth_manager: ConnectionManagerBase,
+            db_conn: DatabaseConnection,
+            max_cached_vms: int = 1024):
         self.auth_manager = auth_manager
         self.db_conn = db_conn
+        self.max_cached_vms = max_cached_vms
         self._vms: Dict[int, VM] = {}
+        # Ids of the cached VMs without a connection, least recently used first. Only these count towards
+        # max_cached_vms and can be evicted: a VM holding a connection, even a logged out one, stays in _vms
+        # so that delete_vm() can still release it
+        self._evictable: OrderedDict[int, None] = OrderedDict()
+        # (ram, cpu, drives JSON) each VM's specs were last built from by get_info(); other writers drop the entry
+        self._specs_keys: Dict[int, Tuple[int, int, str]] = {}
         self._initialized = False
+        # Writes to one VM are serialized so the client is synced with its specs in the order they were stored.
+        # A lock exists only while some call holds or waits for it, and VMs never wait on each other's locks
+        self._vm_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+    def _vm_lock(self, vm_id: int) -> asyncio.Lock:
+        lock = self._vm_locks.get(vm_id)
+        if lock is None:
+            lock = self._vm_locks[vm_id] = asyncio.Lock()
+        return lock
+
+    def _remember(self, vm_id: int, vm: VM) -> VM:
+        # Also called when a VM gets or loses its connection, to move it out of or back into the evictable set
+        self._vms[vm_id] = vm
+        if vm.connection is not None:
+            self._evictable.pop(vm_id, None)
+            return vm
 
+        self._evictable[vm_id] = None
+        self._evictable.move_to_end(vm_id)
+        while len(self._evictable) > self.max_cached_vms:
+            old_id, _ = self._evictable.popitem(last=False)
+            self._vms.pop(old_id, None)
+            self._specs_keys.pop(old_id, None)
+        return vm
+
+    # Callers check _initialized inline and only await this on the cold path;
+    # concurrent first calls are serialized by DatabaseConnection.connect()
     async def initialize(self):
         if not self._initialized:
             await self.db_conn.connect()
@@ -151,26 +213,16 @@ class VMService(VMServiceBase):
             await self.db_conn.disconnect()
             self._initialized = False
 
-    async def _ensure_initialized(self):
+    async def create(self, ram: int, cpu: int, hds: List[HardDrive]) -> VM:
         if not self._initialized:
             await self.initialize()
-
-    async def create(self, ram: int, cpu: int, hds: List[HardDrive]) -> VM:
-        await self._ensure_initialized()
         async with self.db_conn.transaction() as uow:
             vm_id = await uow.vms.add(ram, cpu)
-
-            for hd in hds:
-                await uow.drives.add(vm_id, hd.size)
-
-            drives = await uow.drives.get_for_vm(vm_id)
-            hds_with_ids = [HardDrive(id=d['id'], size=d['size']) for d in drives]
+            drives = await uow.drives.add_many(vm_id, [hd.size for hd in hds]) if hds else []
+            hds_with_ids = [HardDrive(id=d['id'], size=d['size'], vm_id=vm_id) for d in drives]
 
             specs = VMSpecs(id=vm_id, ram=ram, cpu=cpu, hard_drives=hds_with_ids)
-            vm = VM(specs=specs)
-            self._vms[vm_id] = vm
-
-            return vm
+            return self._remember(vm_id, VM(specs=specs))
 
     # TODO: Refactor this method - TO BIG!!!
     async def update_info(
@@ -179,68 +231,66 @@ class VMService(VMServiceBase):
             ram: Optional[int],
             cpu: Optional[int],
             hds: Optional[List[HardDrive]]) -> VM:
-        await self._ensure_initialized()
-        vm = self._vms[vm_id]
-        if not vm.connection:
-            logger.error(f"VM with id {vm_id} not authenticated")
-            raise ValueError(f"VM with id {vm_id} not authenticated")
-
-        async with self.db_conn.transaction() as uow:
-            vm_data = await uow.vms.get(vm_id)
-            if not vm_data:
-                logger.error(f"VM with id {vm_id} not found")
-                raise ValueError(f"VM with id {vm_id} not found")
+        if not self._initialized:
+            await self.initialize()
+        async with self._vm_lock(vm_id):
+            vm = self._vms.get(vm_id)
+            if not vm or not vm.connection:
+                logger.error("VM with id %s not authenticated", vm_id)
+                raise ValueError(f"VM with id {vm_id} not authenticated")
+
+            async with self.db_conn.transaction() as uow:
+                # Drives are written first so the final UPDATE ... RETURNING already reports the new drive list
+                if hds is not None:
+                    new_sizes = [hd.size for hd in hds if hd.id == 0]
+                    if new_sizes:
+                        logger.info("Adding %d hard drives for VM %s", len(new_sizes), vm_id)
+                        await uow.drives.add_many(vm_id, new_sizes)
+
+                    resized = {hd.id: hd.size for hd in hds if hd.id != 0}
+                    if resized:
+                        logger.info("Updating %d hard drives for VM %s", len(resized), vm_id)
+                        await uow.drives.update_many(vm_id, resized)
+
+                vm_data = await uow.vms.update(vm_id, ram, cpu)
+                if not vm_data:
+                    logger.error("VM with id %s not found", vm_id)
+                    raise ValueError(f"VM with id {vm_id} not found")
+                hds_updated = _drives_adapter.validate_json(vm_data['hds'])
 
-            if ram is not None or cpu is not None:
-                await uow.vms.update(
-                    vm_id,
-                    ram if ram is not None else vm_data['ram'],
-                    cpu if cpu is not None else vm_data['cpu']
+                specs = VMSpecs(
+                    id=vm_id,
+                    ram=vm_data['ram'],
+                    cpu=vm_data['cpu'],
+                    hard_drives=hds_updated
                 )
 
-            if hds is not None:
-
-                for hd in hds:
-                    if hd.id == 0:
-                        logger.info(f"Adding hard drive {hd.id} for VM {vm_id}")
-                        await uow.drives.add(vm_id, hd.size)
-                    else:
-                        logger.info(f"Updating hard drive {hd.id} for VM {vm_id}")
-                        await uow.drives.update(hd.id, hd.size)
-
-            vm_data = await uow.vms.get(vm_id)
-            drives = await uow.drives.get_for_vm(vm_id)
-            hds_updated = [HardDrive(id=d['id'], size=d['size']) for d in drives]
-
-            specs = VMSpecs(
-                id=vm_id,
-                ram=vm_data['ram'],
-                cpu=vm_data['cpu'],
-                hard_drives=hds_updated
-            )
-
-            r = UpdateClientSpecs(id=None, ram=ram, cpu=cpu, hds=hds_updated)
-            auth_result = await vm.connection.send_command(r)
-            auth_result = json.loads(auth_result)
-            if auth_result['status'] == 'ok':
-                if vm:
-                    self._vms[vm_id].specs = specs
+                r = UpdateClientSpecs(id=None, ram=ram, cpu=cpu, hds=hds_updated)
+                auth_result = await vm.connection.send_command(r)
+                if auth_result.status == Status.OK:
+                    self._specs_keys.pop(vm_id, None)
+                    vm.specs = specs
+                    return vm
                 else:
-                    self._vms[vm_id] = VM(specs=specs)
-
-                return self._vms[vm_id]
-            else:
-                raise ValueError(f"Failed to update VM specs: {auth_result['message']}")
+                    raise ValueError(f"Failed to update VM specs: {auth_result.message}")
 
     async def get_info(self, vm_id: int) -> VM:
-        await self._ensure_initialized()
-        async with self.db_conn.transaction() as uow:
-            vm_data = await uow.vms.get(vm_id)
+        if not self._initialized:
+            await self.initialize()
+        async with self.db_conn.read() as uow:
+            vm_data = await uow.vms.get_with_drives(vm_id)
             if not vm_data:
                 raise ValueError(f"VM with id {vm_id} not found")
 
-            drives = await uow.drives.get_for_vm(vm_id)
-            hds = [HardDrive(id=d['id'], size=d['size']) for d in drives]
+            # The cached specs are kept as long as the row they were built from is unchanged
+            key = (vm_data['ram'], vm_data['cpu'], vm_data['hds'])
+            vm = self._vms.get(vm_id)
+            if vm and self._specs_keys.get(vm_id) == key:
+                if vm_id in self._evictable:
+                    self._evictable.move_to_end(vm_id)
+                return vm
+
+            hds = _drives_adapter.validate_json(vm_data['hds'])
 
             specs = VMSpecs(
                 id=vm_id,
@@ -249,129 +299,173 @@ class VMService(VMServiceBase):
                 hard_drives=hds
             )
 
-            if vm_id in self._vms:
-                self._vms[vm_id].specs = specs
+            if vm:
+                vm.specs = specs
             else:
-                self._vms[vm_id] = VM(specs=specs)
+                vm = VM(specs=specs)
+            self._specs_keys[vm_id] = key
 
-            return self._vms[vm_id]
+            return self._remember(vm_id, vm)
 
-    async def list_vms(self) -> List[VM]:
-        await self._ensure_initialized()
-        async with self.db_conn.transaction() as uow:
-            vms_data = await uow.vms.get_all()
-            vms = []
+    async def remove_drive(self, vm_id: int, drive_id: int) -> List[HardDrive]:
+        if not self._initialized:
+            await self.initialize()
+        async with self._vm_lock(vm_id):
+            async with self.db_conn.transaction() as uow:
+                row = await uow.drives.remove_and_list(vm_id, drive_id)
+            if not row['removed']:
+                raise ValueError(f"Drive {drive_id} not found on VM {vm_id}")
+            hds = _drives_adapter.validate_json(row['hds'])
+
+            vm = self._vms.get(vm_id)
+            if vm:
+                vm.specs.hard_drives = hds
+                self._specs_keys.pop(vm_id, None)
+                if vm.connection:
+                    result = await vm.connection.send_command(UpdateClientSpecs(id=None, ram=None, cpu=None, hds=hds))
+                    if result.status != Status.OK:
+                        logger.warning("Failed to sync drives of VM %s: %s", vm_id, result.message)
+
+            return hds
+
+    async def list_vms(self, list_type: str = 'all') -> List[VM]:
+        if not self._initialized:
+            await self.initialize()
+        if list_type == 'connected':
+            wanted: Optional[List[int]] = await self.auth_manager.get_connected()
+        elif list_type == 'authenticated':
+            wanted = await self.auth_manager.get_athenificated()
+        else:
+            wanted = None
+        if wanted == []:
+            return []
+
+        async with self.db_conn.read() as uow:
+            if wanted is None:
+                vms_data = await uow.vms.get_all()
+            else:
+                vms_data = await uow.vms.get_many(wanted)
 
-            for vm_data in vms_data:
-                drives = await uow.drives.get_for_vm(vm_data['id'])
-                hds = [HardDrive(id=d['id'], size=d['size']) for d in drives]
+            # Drives of every listed VM in one query, grouped here instead of a query per VM
+            drives_by_vm: DefaultDict[int, List[HardDrive]] = defaultdict(list)
+            for d in await uow.drives.get_for_vms([vm_data['id'] for vm_data in vms_data]):
+                drives_by_vm[d['vm_id']].append(HardDrive(id=d['id'], size=d['size'], vm_id=d['vm_id']))
 
+            vms = []
+            for vm_data in vms_data:
                 specs = VMSpecs(
                     id=vm_data['id'],
                     ram=vm_data['ram'],
                     cpu=vm_data['cpu'],
-                    hard_drives=hds
+                    hard_drives=drives_by_vm[vm_data['id']]
                 )
-                if vm_data['id'] in self._vms:
-                    self._vms[vm_data['id']].specs = specs
-                    self._vms[vm_data['id']].last_connected = vm_data['last_connected']
-                    vms.append(self._vms[vm_data['id']])
+                vm = self._vms.get(vm_data['id'])
+                if vm:
+                    self._specs_keys.pop(vm_data['id'], None)
+                    vm.specs = specs
                 else:
                     vm = VM(specs=specs)
-                    vm.last_connected = vm_data['last_connected']
-                    self._vms[vm_data['id']] = vm
-                    vms.append(vm)
+                vm.last_connected = vm_data['last_connected']
+                vms.append(self._remember(vm_data['id'], vm))
 
             return vms
 
     async def delete_vm(self, vm_id: int) -> bool:
-        await self._ensure_initialized()
-        async with self.db_conn.transaction() as uow:
-            if vm_id in self._vms:
-                vm = self._vms[vm_id]
+        if not self._initialized:
+            await self.initialize()
+        async with self._vm_lock(vm_id):
+            vm = self._vms.get(vm_id)
+            if vm and vm.connection:
+                # A failed logout does not keep the VM from being deleted, its connection is closed either way
                 if vm.is_connected:
-                    await self.disconnect(vm_id)
-                del self._vms[vm_id]
-
-            drives = await uow.drives.get_for_vm(vm_id)
-            for drive in drives:
-                await uow.drives.remove(drive['id'])
-
-            # TODO: Add VM deletion from database
-            return True
+                    try:
+                        await self.auth_manager.logout(vm_id)
+                    except Exception as e:
+                        logger.warning("Logout from VM %s before deleting it failed: %s", vm_id, e)
+                await self.auth_manager.release(vm_id, vm.connection)
+                vm.connection = None
+                vm.is_connected = False
+                self._remember(vm_id, vm)
+
+            async with self.db_conn.transaction() as uow:
+                deleted = await uow.vms.delete(vm_id)
+
+            self._vms.pop(vm_id, None)
+            self._evictable.pop(vm_id, None)
+            self._specs_keys.pop(vm_id, None)
+            return deleted
 
     async def connect(self, vm_id: int, host: str, port: int, username: str, password: str) -> bool:
-        await self._ensure_initialized()
-        async with self.db_conn.transaction() as uow:
-            try:
-                vm = await self.get_info(vm_id) if vm_id != 0 else None
-                if vm is None:
-                    vm = await self.create(ram=1, cpu=1, hds=[HardDrive(size=4, vm_id=0, id=0)])
-                    vm_id = vm.specs.id
-
-                logging.debug(f"Connecting to VM {vm_id}")
-                connection = await self.auth_manager.connect(vm_id, host, port)
-                auth_result = await self.auth_manager.authenticate(vm_id=vm_id, username=username, password=password)
-
-                if not auth_result:
-                    logging.error(f"Authentication failed for VM {vm_id}")
-                    await connection.close()
-                    return False
-
-                vm.connection = connection
-                vm.is_connected = True
-                vm.last_connected = datetime.now()
-                self._vms[vm_id] = vm
+        if not self._initialized:
+            await self.initialize()
+        try:
+            if vm_id == 0:
+                vm = await self.create(ram=1, cpu=1, hds=[HardDrive(size=4, vm_id=0, id=0)])
+                vm_id = vm.specs.id
+                logger.debug("Connecting to VM %s", vm_id)
+                connection = await self.auth_manager.connect_and_authenticate(vm_id, host, port, username, password)
+            else:
+                logger.debug("Connecting to VM %s", vm_id)
+                # The VM lookup and the connect + authenticate handshake are independent, so they overlap
+                vm_result, conn_result = await asyncio.gather(
+                    self.get_info(vm_id),
+                    self.auth_manager.connect_and_authenticate(vm_id, host, port, username, password),
+                    return_exceptions=True
+                )
+                if isinstance(conn_result, BaseException):
+                    raise conn_result
+                connection = conn_result
+                if isinstance(vm_result, BaseException):
+                    if connection is not None:
+                        await self.auth_manager.release(vm_id, connection)
+                    raise vm_result
+                vm = vm_result
+
+            if connection is None:
+                logger.error("Authentication failed for VM %s", vm_id)
+                return False
 
+            vm.connection = connection
+            vm.is_connected = True
+            vm.last_connected = datetime.now()
+            self._remember(vm_id, vm)
+
+            # A pooled connection is only held for the write, not during the network round-trips above
+            async with self.db_conn.transaction() as uow:
                 await uow.vms.update_connection_time(vm_id)
 
-                logger.info(f"Connected to VM {vm_id}")
-                return True
+            logger.info("Connected to VM %s", vm_id)
+            return True
 
-            except Exception as e:
-                logger.error(f"Connection failed: {e}")
-                return False
+        except Exception as e:
+            logger.error("Connection failed: %s", e)
+            return False
 
     async def logout(self, vm_id: int) -> bool:
-        print("logging out")
+        logger.debug("Logging out of VM %s", vm_id)
         if vm_id not in self._vms:
             return False
 
         vm = self._vms[vm_id]
         if not vm.is_connected:
-            print("VM is not connected")
+            logger.debug("VM %s is not connected", vm_id)
             return False
-        print("sending logout request")
         result = await self.auth_manager.logout(vm_id)
         if result:
-            print("Logged out successfully")
+            logger.debug("Logged out of VM %s", vm_id)
             vm.is_connected = False
 
         return result
 
     async def get_connected(self) -> List[VM]:
-        vm_ids = await self.auth_manager.get_connected()
-        return [await self.get_info(vm_id) for vm_id in vm_ids]
+        return await self.list_vms('connected')
 
     async def get_athenificated(self) -> List[VM]:
-        vm_ids = await self.auth_manager.get_athenificated()
-        return [await self.get_info(vm_id) for vm_id in vm_ids]
+        return await self.list_vms('authenticated')
 
     async def list_drives(self, vm_id: int | None = None) -> List[HardDrive]:
-        await self._ensure_initialized()
-        async with self.db_conn.transaction() as uow:
-            drives_list = []
-
-            if vm_id is None:
-                drives = await uow.drives.get_all()
-            else:
-                drives = await uow.drives.get_for_vm(vm_id)
-
-            if drives is None:
-                return []
-
-            for d in drives:
-                dieve_specs = HardDrive(**d)
-                drives_list.append(dieve_specs)
-
-            return drives_list
+        if not self._initialized:
+            await self.initialize()
+        async with self.db_conn.read() as uow:
+            drives = await uow.drives.list_json(vm_id)
+        return _drives_adapter.validate_json(drives)
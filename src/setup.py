@@ -0,0 +1,26 @@
+"""Optional ahead-of-time compilation of the request hot path with mypyc.
+
+    pip install mypy setuptools
+    python setup.py build_ext --inplace
+
+The compiled extensions are placed next to the sources and take precedence on import;
+deleting the *.so files falls back to the plain .py modules.
+"""
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name='red-vm-speedups',
+    ext_modules=mypycify(
+        [
+            # Only the listed modules are compiled, the modules they import stay interpreted
+            '--ignore-missing-imports',
+            '--explicit-package-bases',
+            '--follow-imports=silent',
+            'api/server.py',
+            'api/handlers/server/handler.py',
+            'api/handlers/client/handler.py',
+        ],
+        opt_level='3',
+    ),
+)